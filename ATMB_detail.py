@@ -1,7 +1,13 @@
+import asyncio
 import csv
-import requests
-from bs4 import BeautifulSoup
+import functools
+import hashlib
+import random
+import socket
 import time
+import httpx
+from bs4 import BeautifulSoup, SoupStrainer
+from html.parser import HTMLParser
 import re
 import os
 import argparse
@@ -12,56 +18,247 @@ import sys
 DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
+# Starting / maximum in-flight request budget; the AIMD limiter adapts between 1 and the max.
+# With HTTP/2 the in-flight requests multiplex as streams over very few connections.
+CONCURRENT_REQUESTS = 10
+MAX_CONCURRENT_REQUESTS = 20
+CLIENT_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=50)
+
+# Python does not cache DNS lookups, so every new connection re-resolves the
+# same host. Cache getaddrinfo process-wide (flags dropped from the key so
+# equivalent lookups share an entry).
+_real_getaddrinfo = socket.getaddrinfo
+
+@functools.lru_cache(maxsize=32)
+def _cached_getaddrinfo(host, port, family=0, type=0, proto=0):
+    return _real_getaddrinfo(host, port, family, type, proto)
+
+def _getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    # asyncio's loop.getaddrinfo passes flags positionally; normalize it out
+    # of the cache key
+    return _cached_getaddrinfo(host, port, family, type, proto)
+
+socket.getaddrinfo = _getaddrinfo
+
+# Transient failures retry with exponential backoff plus jitter; other 4xx do not
+RETRY_TOTAL = 4
+RETRY_BACKOFF = 0.5
+RETRYABLE_STATUSES = (500, 502, 503, 504)
+
+# Restrict parsing to the address container; skips building a DOM for the rest of the page
+ADDR_STRAINER = SoupStrainer(class_=re.compile(r"\bt-addr\b"))
+
+# One multiline scan over the whole address block: capture a trimmed line
+# holding suite-ish content, rejecting lines with any blacklist phrase
+LINE_RE = re.compile(
+    r'(?m)^(?![^\n]*(?:United States|Your Real Street Address|YOUR NAME))'
+    r'[ \t]*([^\n]*(?:\b(?:Suite|Ste|Unit|Apt)\b|#)[^\n]*?)[ \t]*$',
+    re.IGNORECASE)
+
+class _AddrParser(HTMLParser):
+    """Incremental parser that flags when the first t-addr element has fully
+    closed, so a streaming download can stop without reading the rest of the
+    page."""
+
+    # Void elements never produce an end tag; don't count them toward depth
+    VOID = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+            'link', 'meta', 'source', 'track', 'wbr'}
+
+    def __init__(self):
+        super().__init__()
+        self._depth = 0
+        self.found = False
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self._depth:
+            if tag not in self.VOID:
+                self._depth += 1
+            return
+        classes = (dict(attrs).get('class') or '').split()
+        if 't-addr' in classes:
+            self.found = True
+            self._depth = 1
+
+    def handle_endtag(self, tag):
+        if self._depth and tag not in self.VOID:
+            self._depth -= 1
+            if self._depth == 0:
+                self.done = True
+
+# On-disk page cache: fresh entries skip the network entirely, stale ones
+# are revalidated with If-None-Match / If-Modified-Since (304 = empty body)
+CACHE_DIR = "cache"
+CACHE_TTL = 86400  # seconds a cached page is served without revalidation
+
+def _cache_paths(url):
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    base = os.path.join(CACHE_DIR, digest[:2])
+    return os.path.join(base, digest + ".html"), os.path.join(base, digest + ".meta")
+
+def _cache_load(url):
+    """Returns (html, age_seconds, conditional_headers) for a cached page.
+    html is None on a miss."""
+    html_path, meta_path = _cache_paths(url)
+    try:
+        age = time.time() - os.path.getmtime(html_path)
+        with open(html_path, 'r', encoding='utf-8') as f:
+            html = f.read()
+    except OSError:
+        return None, 0, {}
+
+    headers = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("etag="):
+                    headers["If-None-Match"] = line.split("=", 1)[1]
+                elif line.startswith("last_modified="):
+                    headers["If-Modified-Since"] = line.split("=", 1)[1]
+
+    return html, age, headers
+
+def _cache_store(url, html, response_headers):
+    html_path, meta_path = _cache_paths(url)
+    os.makedirs(os.path.dirname(html_path), exist_ok=True)
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(html)
+
+    etag = response_headers.get("ETag", "")
+    last_modified = response_headers.get("Last-Modified", "")
+    if etag or last_modified:
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            if etag:
+                f.write(f"etag={etag}\n")
+            if last_modified:
+                f.write(f"last_modified={last_modified}\n")
+
+def _retry_after_seconds(headers, default=1.0):
+    """Parses a Retry-After header value in seconds (ignores HTTP-date form)."""
+    try:
+        return float(headers.get("Retry-After", ""))
+    except (TypeError, ValueError):
+        return default
+
+class _AIMDLimiter:
+    """Additive-increase / multiplicative-decrease concurrency gate.
+
+    Halves the in-flight budget on HTTP 429 (honoring Retry-After) and adds
+    one slot back after a run of successes, so throughput adapts to whatever
+    rate the host actually tolerates instead of a fixed guess.
+    """
+
+    def __init__(self, initial, maximum, increase_after=100):
+        self.limit = initial
+        self.maximum = maximum
+        self.increase_after = increase_after
+        self._successes = 0
+        self._inflight = 0
+        self._pause_until = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._inflight < self.limit)
+            self._inflight += 1
+        delay = self._pause_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._cond:
+            self._inflight -= 1
+            self._cond.notify_all()
+        return False
+
+    async def on_success(self):
+        async with self._cond:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.limit < self.maximum:
+                self._successes = 0
+                self.limit += 1
+                self._cond.notify_all()
+
+    async def on_throttle(self, retry_after):
+        async with self._cond:
+            self._successes = 0
+            self.limit = max(1, self.limit // 2)
+        self._pause_until = max(self._pause_until, time.monotonic() + retry_after)
+
+# Any whitespace other than a plain space (NBSP from &nbsp; included), a
+# doubled space, or a space at either edge means the string needs normalizing
+_IRREGULAR_WS_RE = re.compile(r'[^\S ]|  |^ | $')
 
 def clean_text(text):
+    # Fast path: most city/street values are already normalized, so skip the
+    # split-list + join allocations unless the whitespace looks irregular
+    if _IRREGULAR_WS_RE.search(text) is None:
+        return text
     return " ".join(text.split())
 
+# Translate tables do the hyphenation/sanitization in one C-level pass
+# instead of chained .replace() calls
+_CITY_TRANS = str.maketrans({' ': '-'})
+_STREET_TRANS = str.maketrans({' ': '-', '.': '', '#': ''})
+
+@functools.lru_cache(maxsize=4096)
 def construct_url(city, street_address):
-    # Rule: lowercase, replace spaces with hyphens
-    city_slug = clean_text(city).lower().replace(' ', '-')
-    street_slug = clean_text(street_address).lower().replace(' ', '-')
-    # Basic sanitization for URL
-    street_slug = street_slug.replace('.', '').replace('#', '')
+    # Rule: lowercase, replace spaces with hyphens (many rows share a city,
+    # hence the cache)
+    city_slug = clean_text(city).lower().translate(_CITY_TRANS)
+    street_slug = clean_text(street_address).lower().translate(_STREET_TRANS)
     return f"https://www.anytimemailbox.com/s/{city_slug}-{street_slug}"
 
 def extract_suite_info(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
-    # Target the specific address container to avoid footer (e.g., "Suite 244" in footer)
+    # The strainer already limits the tree to address containers; take the first one
+    # to avoid footer matches (e.g., "Suite 244" in footer)
+    soup = BeautifulSoup(html_content, 'lxml', parse_only=ADDR_STRAINER)
     addr_container = soup.find(class_='t-addr')
     if not addr_container:
         return ""
 
-    # Get text specifically from the address container
+    # Get text specifically from the address container; LINE_RE filters and
+    # trims candidate lines in a single C-level pass instead of
+    # split/strip/search per line
     text = addr_container.get_text(separator="\n")
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-    
-    for line in lines:
-        # Filter out common non-suite lines
-        if "United States" in line or "Your Real Street Address" in line or "YOUR NAME" in line:
-            continue
-            
-        # Check for Suite/Ste/Unit/Apt/#
-        # We want lines that specifically look like unit info
-        if re.search(r'\b(Suite|Ste|Unit|Apt)\b|[#]', line, re.IGNORECASE):
-            # Remove "MAILBOX" placeholder if present
-            clean_line = line.replace("MAILBOX", "").strip()
-            # If line is just "#", it might be empty unit info, but let's return it if it looks like content
-            if len(clean_line) > 1: 
-                return clean_line
-            
+
+    for match in LINE_RE.finditer(text):
+        # Remove "MAILBOX" placeholder if present
+        clean_line = match.group(1).replace("MAILBOX", "").strip()
+        # If line is just "#", it might be empty unit info, but let's return it if it looks like content
+        if len(clean_line) > 1:
+            return clean_line
+
     return ""
 
-def save_csv(filename, fieldnames, rows):
-    temp_file = filename + ".tmp"
-    with open(temp_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
-    # atomic replace if possible, or just rename
-    if os.path.exists(filename):
-        os.remove(filename)
-    os.rename(temp_file, filename)
+def _read_rows(path):
+    """Loads a CSV into (fieldnames, list of row dicts), all values as strings.
+
+    Prefers polars (Rust-backed columnar reader), then pandas, then the
+    stdlib csv module, so the script still runs with minimal dependencies.
+    """
+    try:
+        import polars as pl
+    except ImportError:
+        pl = None
+    if pl is not None:
+        df = pl.read_csv(path, infer_schema_length=0).fill_null("")
+        return list(df.columns), df.to_dicts()
+
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+    if pd is not None:
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        return list(df.columns), df.to_dict('records')
+
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        return list(reader.fieldnames or []), list(reader)
 
 def process_file(input_file, output_file=None):
     if not os.path.exists(input_file):
@@ -78,32 +275,42 @@ def process_file(input_file, output_file=None):
     print(f"Processing: {input_file} -> {output_file}", flush=True)
     
     # Read input
-    all_rows = []
-    with open(input_file, 'r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
-        for row in reader:
-            all_rows.append(row)
-            
+    fieldnames, all_rows = _read_rows(input_file)
+
     if not all_rows:
         print("  No rows found.", flush=True)
         return
 
-    # Check if we are resuming
-    processed_count = 0
-    if os.path.exists(output_file):
-        print(f"  Resuming from existing output file: {output_file}", flush=True)
-        with open(output_file, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            # Load existing processed extracted data to mapped by ID or index
-            # Since rows usually don't have ID, we might need to rely on index or matching address
-            # Simpler approach: Just load the output file as the starting point for 'all_rows'
-            # IF the output file has more/same rows as input.
-            saved_rows = list(reader)
-            if len(saved_rows) >= len(all_rows):
-                all_rows = saved_rows
-                if 'Suite/Apartment' not in fieldnames and 'Suite/Apartment' in reader.fieldnames:
-                    fieldnames = reader.fieldnames
+    # Rows stream to a temp file that replaces the output only on completion,
+    # so a crash mid-run never truncates an in-place _detailed update
+    temp_file = output_file + ".tmp"
+
+    # Check if we are resuming: merge suite info from a previous run's output
+    # (or an interrupted run's temp file) into the input rows, keyed by
+    # address (rows usually carry no ID)
+    saved_suites = {}
+    for previous in (output_file, temp_file):
+        if not os.path.exists(previous):
+            continue
+        print(f"  Resuming from existing output file: {previous}", flush=True)
+        try:
+            saved_fields, saved_rows = _read_rows(previous)
+        except Exception:
+            # A temp file cut off mid-row by a crash is best-effort only
+            continue
+        if 'Suite/Apartment' not in saved_fields:
+            continue
+        for saved in saved_rows:
+            suite = saved.get('Suite/Apartment', '').strip()
+            if suite:
+                key = (saved.get('Street Address', ''), saved.get('City', ''))
+                saved_suites[key] = suite
+    if saved_suites:
+        for row in all_rows:
+            if not row.get('Suite/Apartment', '').strip():
+                key = (row.get('Street Address', ''), row.get('City', ''))
+                if key in saved_suites:
+                    row['Suite/Apartment'] = saved_suites[key]
 
     # Ensure 'Suite/Apartment' column exists
     if 'Suite/Apartment' not in fieldnames:
@@ -111,71 +318,176 @@ def process_file(input_file, output_file=None):
 
     total = len(all_rows)
     success_count = 0
-    updated_any = False
 
+    # Split rows into those finished as-is and those that still need a fetch,
+    # grouping the latter by URL: duplicate locations are fetched only once
+    # and the result fanned out to every row in the bucket. Finished rows
+    # collect in `completed` and flush as a contiguous prefix so the output
+    # keeps the input row order despite out-of-order completions.
+    url_to_rows = {}
+    completed = {}
     for idx, row in enumerate(all_rows):
-        # timestamp for progress speed
-        
         # Check if already processed
         current_suite = row.get('Suite/Apartment', '').strip()
         if current_suite:
             # Already has data, skip (assume correct or previously extracted)
             success_count += 1
+            completed[idx] = row
             continue
-            
+
         city = row.get('City', '')
         street = row.get('Street Address', '')
-        
+
         if not city or not street:
+            completed[idx] = row
             continue
-            
+
         detail_url = row.get('Detail Url', '').strip()
         if detail_url:
             url = detail_url
         else:
             url = construct_url(city, street)
-            
-        print(f"  [{idx+1}/{total}] {city}, {street}", end='', flush=True)
-        
-        try:
-            response = requests.get(url, headers=DEFAULT_HEADERS, timeout=10)
-            
-            # Check for redirect
-            if response.url != url:
-                 # Sometimes simple slash differences or query params are ok, but major changes indicate redirect
-                 # e.g. https://www.anytimemailbox.com/locations
-                 if "locations" in response.url or response.url.strip("/") == "https://www.anytimemailbox.com":
-                     print(f" -> Redirected to {response.url} (URL mismatch)", flush=True)
-                     continue
-
-            if response.status_code == 200:
-                suite_info = extract_suite_info(response.text)
-                if suite_info:
-                    print(f" -> Found: {suite_info}", flush=True)
-                    row['Suite/Apartment'] = suite_info
-                    success_count += 1
-                    updated_any = True
+
+        url_to_rows.setdefault(url, []).append((idx, row))
+
+    async def fetch(client, url, limiter):
+        cached, age, cond_headers = _cache_load(url)
+        if cached is not None and age < CACHE_TTL:
+            # Fresh enough: no request at all
+            return 200, url, cached
+
+        last_exc = None
+        status = None
+        final_url = url
+        text = ""
+        for attempt in range(RETRY_TOTAL + 1):
+            if attempt:
+                # Exponential backoff with uniform jitter to avoid retry storms
+                backoff = RETRY_BACKOFF * (2 ** (attempt - 1))
+                await asyncio.sleep(backoff + random.uniform(0, RETRY_BACKOFF))
+            try:
+                async with limiter:
+                    async with client.stream("GET", url, headers=cond_headers) as response:
+                        status = response.status_code
+                        final_url = str(response.url)
+                        if status == 429:
+                            await limiter.on_throttle(_retry_after_seconds(response.headers))
+                            continue
+                        if status in RETRYABLE_STATUSES:
+                            continue
+                        if status == 304 and cached is not None:
+                            # Upstream unchanged; reuse the cached body
+                            _cache_store(url, cached, response.headers)
+                            await limiter.on_success()
+                            return 200, url, cached
+                        if status != 200:
+                            await response.aread()
+                            return status, final_url, response.text
+
+                        # Stream the body and stop as soon as the address
+                        # container has closed; leaving the context drops the
+                        # remaining bytes on the floor
+                        parser = _AddrParser()
+                        chunks = []
+                        async for chunk in response.aiter_text():
+                            chunks.append(chunk)
+                            parser.feed(chunk)
+                            if parser.done:
+                                break
+                        text = "".join(chunks)
+                        _cache_store(url, text, response.headers)
+                        await limiter.on_success()
+                        return status, final_url, text
+            except httpx.HTTPError as e:
+                last_exc = e
+
+        # Retries exhausted: surface the last failure
+        if status is None and last_exc is not None:
+            raise last_exc
+        return status, final_url, text
+
+    async def _run(flush_completed):
+        nonlocal success_count
+        limiter = _AIMDLimiter(CONCURRENT_REQUESTS, MAX_CONCURRENT_REQUESTS)
+
+        async def worker(url, bucket):
+            try:
+                status, final_url, text = await fetch(client, url, limiter)
+                return url, bucket, status, final_url, text, None
+            except Exception as e:
+                return url, bucket, None, None, None, e
+
+        # HTTP/2 multiplexes the in-flight requests as streams over a couple
+        # of connections, so the TLS handshake cost amortizes to nothing
+        async with httpx.AsyncClient(http2=True, headers=DEFAULT_HEADERS,
+                                     limits=CLIENT_LIMITS, timeout=10,
+                                     follow_redirects=True) as client:
+            tasks = [asyncio.create_task(worker(url, bucket)) for url, bucket in url_to_rows.items()]
+
+            # Stream results to extract_suite_info as each fetch finishes
+            for future in asyncio.as_completed(tasks):
+                url, bucket, status, final_url, text, error = await future
+                idx, row = bucket[0]
+                city = row.get('City', '')
+                street = row.get('Street Address', '')
+                dupes = f" (x{len(bucket)} rows)" if len(bucket) > 1 else ""
+                print(f"  [{idx+1}/{total}] {city}, {street}{dupes}", end='', flush=True)
+
+                suite_info = ""
+                if error is not None:
+                    print(f" -> Error: {error}", flush=True)
                 else:
-                    # Debug: check why
-                    if "t-addr" not in response.text:
-                         print(f" -> No .t-addr found in page", flush=True)
+                    # Check for redirect
+                    # Sometimes simple slash differences or query params are ok, but major changes indicate redirect
+                    # e.g. https://www.anytimemailbox.com/locations
+                    if final_url != url and ("locations" in final_url or final_url.strip("/") == "https://www.anytimemailbox.com"):
+                        print(f" -> Redirected to {final_url} (URL mismatch)", flush=True)
+                    elif status == 200:
+                        suite_info = extract_suite_info(text)
+                        if suite_info:
+                            print(f" -> Found: {suite_info}", flush=True)
+                        else:
+                            # Debug: check why
+                            if "t-addr" not in text:
+                                print(f" -> No .t-addr found in page", flush=True)
+                            else:
+                                print(f" -> No info extracted (Regex mismatch?)", flush=True)
                     else:
-                         print(f" -> No info extracted (Regex mismatch?)", flush=True)
-            else:
-                print(f" -> Failed ({response.status_code})", flush=True)
-                
-        except Exception as e:
-            print(f" -> Error: {e}", flush=True)
-        
-        # Incremental save every 10 rows or if it's the last one
-        if updated_any and (idx % 10 == 0 or idx == total - 1):
-             save_csv(output_file, fieldnames, all_rows)
-             updated_any = False # Reset flag
-        
-        time.sleep(0.5) 
+                        print(f" -> Failed ({status})", flush=True)
+
+                # Fan the result out to every row sharing this URL and flush
+                # whatever prefix of the input is now complete; O(N) instead
+                # of rewriting the whole file every few rows
+                for idx, row in bucket:
+                    if suite_info:
+                        row['Suite/Apartment'] = suite_info
+                        success_count += 1
+                    completed[idx] = row
+                flush_completed()
+
+    with open(temp_file, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.DictWriter(out, fieldnames=fieldnames)
+        writer.writeheader()
+
+        next_write = 0
+
+        def flush_completed():
+            # Write the longest contiguous run of finished rows, preserving
+            # input order in the output file
+            nonlocal next_write
+            while next_write in completed:
+                writer.writerow(completed.pop(next_write))
+                next_write += 1
+            out.flush()
+
+        # Rows needing no fetch flush immediately
+        flush_completed()
+
+        if url_to_rows:
+            asyncio.run(_run(flush_completed))
 
-    # Final save
-    save_csv(output_file, fieldnames, all_rows)
+    # Atomic swap once every row has been written
+    os.replace(temp_file, output_file)
     print(f"  Complete. Saved to {output_file}. (Filled: {success_count}/{total})", flush=True)
 
 def main():
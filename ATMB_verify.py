@@ -1,13 +1,121 @@
 import argparse
 import csv
+import functools
 import os
+import random
+import socket
 import sys
-import requests
+import threading
 import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- Configuration ---
 SMARTY_API_URL = "https://us-street.api.smarty.com/street-address"
 CREDENTIALS_FILE = "smarty_api_key.txt"
+# Smarty's us-street endpoint accepts up to 100 lookups per JSON POST
+BATCH_SIZE = 100
+# Batches POSTed concurrently; Smarty handles far more in-flight requests than this
+MAX_WORKERS = 20
+
+# Python does not cache DNS lookups, so every new connection re-resolves the
+# same host. Cache getaddrinfo process-wide (flags dropped from the key so
+# equivalent lookups share an entry).
+_real_getaddrinfo = socket.getaddrinfo
+
+@functools.lru_cache(maxsize=32)
+def _cached_getaddrinfo(host, port, family=0, type=0, proto=0):
+    return _real_getaddrinfo(host, port, family, type, proto)
+
+def _getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    # Callers may pass flags positionally; normalize it out of the cache key
+    return _cached_getaddrinfo(host, port, family, type, proto)
+
+socket.getaddrinfo = _getaddrinfo
+
+# Shared session: every call hits the same Smarty host, so a pooled
+# keep-alive connection skips the TCP+TLS handshake after the first request.
+class _JitterRetry(Retry):
+    """Retry with uniform random jitter on top of the exponential backoff
+    (urllib3 does not jitter by default), so worker threads that fail at
+    the same moment do not all retry at the same moment."""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return backoff
+        return backoff + random.uniform(0, 0.5)
+
+# Transient failures (timeouts, 5xx, 429) retry in the adapter; other 4xx do
+# not. raise_on_status=False hands the final failing response back instead of
+# raising RetryError, so verify_batch still sees a surviving 429 and can feed
+# the AIMD throttle.
+_RETRY = _JitterRetry(total=4, backoff_factor=0.5,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET", "POST"),
+                      respect_retry_after_header=True,
+                      raise_on_status=False)
+
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS, max_retries=_RETRY))
+
+def _retry_after_seconds(headers, default=1.0):
+    """Parses a Retry-After header value in seconds (ignores HTTP-date form)."""
+    try:
+        return float(headers.get("Retry-After", ""))
+    except (TypeError, ValueError):
+        return default
+
+class _AIMDThrottle:
+    """Additive-increase / multiplicative-decrease gate for the worker pool.
+
+    Halves the number of batches allowed in flight when Smarty answers 429
+    (honoring Retry-After) and adds one slot back after a run of clean
+    batches, instead of pacing with a fixed sleep.
+    """
+
+    def __init__(self, initial, maximum, increase_after=10):
+        self.limit = initial
+        self.maximum = maximum
+        self.increase_after = increase_after  # consecutive clean batches per +1
+        self._successes = 0
+        self._inflight = 0
+        self._pause_until = 0.0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._inflight < self.limit)
+            self._inflight += 1
+        delay = self._pause_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with self._cond:
+            self._inflight -= 1
+            self._cond.notify_all()
+        return False
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.limit < self.maximum:
+                self._successes = 0
+                self.limit += 1
+                self._cond.notify_all()
+
+    def on_throttle(self, retry_after):
+        with self._cond:
+            self._successes = 0
+            self.limit = max(1, self.limit // 2)
+        self._pause_until = max(self._pause_until, time.monotonic() + retry_after)
+
+# Start below the ceiling so additive increase has somewhere to go
+THROTTLE = _AIMDThrottle(MAX_WORKERS // 2, MAX_WORKERS)
 
 def load_credentials(filepath):
     """Loads Auth ID and Auth Token from the specified file."""
@@ -35,45 +143,42 @@ def load_credentials(filepath):
         
     return auth_id, auth_token
 
-def verify_address(auth_id, auth_token, street, city, state, zipcode, secondary=""):
+def verify_batch(auth_id, auth_token, lookups):
     """
-    Verifies a single address using Smarty API.
-    Returns (rdi, cmra) or (None, None) if validation fails.
+    Verifies up to BATCH_SIZE addresses in a single Smarty JSON POST.
+    lookups is a list of lookup dicts, each carrying a unique "input_id".
+    Returns {input_id: (rdi, cmra)}. IDs absent from the response had no match.
     """
     params = {
         "auth-id": auth_id,
-        "auth-token": auth_token,
-        "street": street,
-        "city": city,
-        "state": state,
-        "zipcode": zipcode,
-        "candidates": 1,
-        "match": "strict"
+        "auth-token": auth_token
     }
-    
-    if secondary:
-        params["secondary"] = secondary
-        
+
     try:
-        response = requests.get(SMARTY_API_URL, params=params, timeout=10)
+        with THROTTLE:
+            response = SESSION.post(SMARTY_API_URL, params=params, json=lookups,
+                                    headers={"Content-Type": "application/json"}, timeout=30)
+        if response.status_code == 429:
+            THROTTLE.on_throttle(_retry_after_seconds(response.headers))
         response.raise_for_status()
         data = response.json()
-        
-        if not data:
-            return "Invalid", "Invalid"
-            
-        candidate = data[0]
+        THROTTLE.on_success()
+    except Exception as e:
+        print(f"API Error: {e}")
+        return {lookup["input_id"]: ("Error", "Error") for lookup in lookups}
+
+    results = {}
+    for candidate in data:
         metadata = candidate.get("metadata", {})
         analysis = candidate.get("analysis", {})
-        
+
         rdi = metadata.get("rdi", "Unknown")
         cmra = analysis.get("dpv_cmra", "Unknown")
-        
-        return rdi, cmra
-        
-    except Exception as e:
-        print(f"API Error: {e}")
-        return "Error", "Error"
+
+        # Smarty echoes the input_id of the lookup each candidate belongs to
+        results[candidate.get("input_id")] = (rdi, cmra)
+
+    return results
 
 def main():
     parser = argparse.ArgumentParser(description="ATMB Verify Tool: Verify addresses using Smarty API.")
@@ -116,11 +221,12 @@ def main():
     
     rows = []
     # Use 'utf-8-sig' to handle potential BOM in CSV files
+    # Positional reader: no per-row dict allocation, columns accessed by index
     try:
         with open(input_file, 'r', newline='', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            fieldnames = reader.fieldnames
-            if not fieldnames:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header:
                  print("Error: Empty CSV or no header.")
                  sys.exit(1)
             for row in reader:
@@ -132,62 +238,110 @@ def main():
         print(f"Error reading CSV: {e}")
         sys.exit(1)
 
-            
-    # Add new columns if not exist
-    # Add new columns, insert after 'Zip Code' if possible
-    # First remove them if they exist to ensure correct positioning
-    if "RDI" in fieldnames:
-        fieldnames.remove("RDI")
-    if "CMRA" in fieldnames:
-        fieldnames.remove("CMRA")
-        
-    if "Zip Code" in fieldnames:
-        zip_idx = fieldnames.index("Zip Code")
-        # Insert in reverse order to appear as Zip -> RDI -> CMRA
-        fieldnames.insert(zip_idx + 1, "CMRA")
-        fieldnames.insert(zip_idx + 1, "RDI")
+    # Drop stale RDI/CMRA columns (from header and every row) so they can be
+    # re-inserted in the right position
+    for name in ("RDI", "CMRA"):
+        if name in header:
+            stale_col = header.index(name)
+            header.pop(stale_col)
+            for row in rows:
+                if len(row) > stale_col:
+                    row.pop(stale_col)
+
+    # New columns land after 'Zip Code' if possible
+    if "Zip Code" in header:
+        insert_at = header.index("Zip Code") + 1
     else:
-        fieldnames.append("RDI")
-        fieldnames.append("CMRA")
-        
+        insert_at = len(header)
+
+    # Cached column indexes for the hot per-row lookups
+    idx = {name: i for i, name in enumerate(header)}
+
+    def col(row, name):
+        i = idx.get(name)
+        return row[i] if i is not None and i < len(row) else ""
+
+    out_header = list(header)
+    out_header[insert_at:insert_at] = ["RDI", "CMRA"]
+
     total = len(rows)
     print(f"Total addresses: {total}")
-    
+
+    # Build one lookup per row, keyed back to the row by input_id
+    lookups = []
+    for i, row in enumerate(rows):
+        secondary = ""
+        if is_detailed:
+            secondary = col(row, "Suite/Apartment").strip()
+
+        # Clean secondary if it is just "#" or looks empty
+        if secondary == "#":
+            secondary = ""
+
+        lookup = {
+            "input_id": str(i),
+            "street": col(row, "Street Address"),
+            "city": col(row, "City"),
+            "state": col(row, "State Abbreviation"),
+            "zipcode": col(row, "Zip Code"),
+            "candidates": 1,
+            "match": "strict"
+        }
+        if secondary:
+            lookup["secondary"] = secondary
+        lookups.append(lookup)
+
+    chunks = [lookups[start:start + BATCH_SIZE] for start in range(0, total, BATCH_SIZE)]
     verified_count = 0
-    
+
+    def write_chunk(writer, chunk, results):
+        nonlocal verified_count
+        out_rows = []
+        for lookup in chunk:
+            row = rows[int(lookup["input_id"])]
+            # No candidate returned means the address did not validate
+            rdi, cmra = results.get(lookup["input_id"], ("Invalid", "Invalid"))
+            out_row = list(row)
+            # Pad short rows so the splice lands in the right columns
+            while len(out_row) < len(header):
+                out_row.append("")
+            out_row[insert_at:insert_at] = [rdi, cmra]
+            out_rows.append(out_row)
+        # One C-level writerows call per chunk instead of per-row dict writes
+        writer.writerows(out_rows)
+        verified_count += len(out_rows)
+
     try:
         with open(output_file, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for i, row in enumerate(rows):
-                street = row.get("Street Address", "")
-                city = row.get("City", "")
-                state = row.get("State Abbreviation", "") 
-                zipcode = row.get("Zip Code", "")
-                
-                secondary = ""
-                if is_detailed:
-                    secondary = row.get("Suite/Apartment", "").strip()
-                    
-                # Clean secondary if it is just "#" or looks empty
-                if secondary == "#":
-                    secondary = ""
-                
-                print(f"[{i+1}/{total}] Verifying: {street} {secondary}, {city}, {state}...", end="", flush=True)
-                
-                rdi, cmra = verify_address(auth_id, auth_token, street, city, state, zipcode, secondary)
-                
-                print(f" -> RDI: {rdi}, CMRA: {cmra}")
-                
-                row["RDI"] = rdi
-                row["CMRA"] = cmra
-                writer.writerow(row)
-                verified_count += 1
-                
-                # Tiny sleep to avoid aggressive looping
-                time.sleep(0.05)
-                
+            writer = csv.writer(f)
+            writer.writerow(out_header)
+
+            # POST batches concurrently; buffer out-of-order completions so the
+            # output file keeps the input row order
+            results_by_chunk = {}
+            next_chunk = 0
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                future_to_idx = {
+                    executor.submit(verify_batch, auth_id, auth_token, chunk): idx
+                    for idx, chunk in enumerate(chunks)
+                }
+                for future in as_completed(future_to_idx):
+                    chunk_idx = future_to_idx[future]
+                    chunk = chunks[chunk_idx]
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        print(f"Batch {chunk_idx+1} failed: {e}")
+                        results = {lookup["input_id"]: ("Error", "Error") for lookup in chunk}
+                    results_by_chunk[chunk_idx] = results
+
+                    matched = sum(1 for lookup in chunk if lookup["input_id"] in results)
+                    print(f"Batch {chunk_idx+1}/{len(chunks)} done ({matched}/{len(chunk)} matched)", flush=True)
+
+                    while next_chunk in results_by_chunk:
+                        write_chunk(writer, chunks[next_chunk], results_by_chunk.pop(next_chunk))
+                        next_chunk += 1
+
         print(f"Done. Verified {verified_count} addresses. Saved to {output_file}")
         
     except PermissionError: